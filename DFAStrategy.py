@@ -1,9 +1,88 @@
 import backtrader as bt
+import numpy as np
 import pandas as pd
-import ccxt
+import requests
+import bisect
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import os
+import sys
+import threading
 import time
 
+try:
+    from numba import njit
+except ImportError:  # numba为可选依赖，缺失时状态机以纯Python执行
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+try:
+    import bottleneck as bn
+except ImportError:  # bottleneck为可选依赖，缺失时滑动平均由前缀和计算
+    bn = None
+
+# DFA_HEADLESS=1 时（CI/服务器环境）使用无界面的Agg后端并跳过绘图
+HEADLESS = os.environ.get('DFA_HEADLESS') == '1'
+if HEADLESS:
+    import matplotlib
+    matplotlib.use('Agg')
+
+# 币安K线接口及代理设置（根据网络环境调整）
+BINANCE_KLINES_URL = 'https://api.binance.com/api/v3/klines'
+PROXIES = {
+    'http': 'http://10.48.175.246:7897',
+    'https': 'http://10.48.175.246:7897',
+}
+# 并发获取K线时的最大线程数（未做限速，避免瞬时请求过多）
+FETCH_MAX_WORKERS = 8
+
+# 回测初始资金：按约30期、3倍基础投资金额预留足够现金
+DEFAULT_INITIAL_CASH = 70 * 30 * 3
+
+# K线数据本地缓存目录
+CACHE_DIR = os.path.expanduser('~/.dfa_cache')
+# 缓存有效期（秒），按文件修改时间判断
+CACHE_TTL = 60 * 60
+
+# 偏离度区间上界（含）及对应投资乘数，最后一档为 > 25%
+_DEV_BOUNDS = np.array([-20.0, -10.0, 0.0, 5.0, 15.0, 25.0], dtype=np.float64)
+_DEV_MULTS = np.array([
+    2.2,  # 极度低估
+    1.8,  # 显著低估
+    1.4,  # 正常偏低
+    1.0,  # 正常估值
+    0.5,  # 正常偏高
+    0.2,  # 显著高估
+    0.0,  # 极度高估
+], dtype=np.float64)
+# 导入时冻结，所有调用共享同一份只读数组
+_DEV_BOUNDS.setflags(write=False)
+_DEV_MULTS.setflags(write=False)
+# 逐K线路径使用的元组副本（bisect对单个标量比np.searchsorted快一个数量级）
+_DEV_BOUNDS_T = tuple(_DEV_BOUNDS.tolist())
+_DEV_MULTS_T = tuple(_DEV_MULTS.tolist())
+
+# 策略中各历史记录列数组的属性名（用于统一扩容）
+_HIST_COLUMNS = ('_hist_date', '_hist_price', '_hist_ma120', '_hist_deviation',
+                 '_hist_multiplier', '_hist_amount', '_hist_shares')
+_PT_COLUMNS = ('_pt_date', '_pt_price', '_pt_return', '_pt_shares', '_pt_amount', '_pt_cost')
+
+# 向量化交易计划：K线序号、动作、份额
+ACTION_BUY = 1
+ACTION_SELL = 2
+PLAN_DTYPE = np.dtype([('bar', np.int32), ('action', np.uint8), ('size', np.float64)])
+
+# 单次定投记录
+InvestmentRecord = collections.namedtuple(
+    'InvestmentRecord', 'date price ma120 deviation multiplier amount shares')
+
+# 交易日志模板（%格式化，参数随日志缓存，stop()输出时才格式化）
+_LOG_SELL = '🎯 减仓卖出: 收益率%.1f%%, 价格$%.2f, 卖出%.4f份额, 获得$%.2f, 利润$%.2f'
+_LOG_INVEST = '第%d期投资: 价格$%.2f, 偏离度%.1f%%, 乘数%.1f, 金额$%.2f, 份额%.4f'
+
 class DFAStrategy(bt.Strategy):
     """
     动态定投策略 (Dynamic Fund Averaging)
@@ -17,54 +96,145 @@ class DFAStrategy(bt.Strategy):
         ('target_return', 75),  # 目标收益率75%减仓
         ('sell_ratio', 0.5),  # 减仓比例50%
         ('profit_taking_cooldown', 30),  #减仓冷却天数
-        ('printlog', True),  # 打印交易日志
+        ('printlog', True),  # 打印交易日志及回测报告
     )
     
     def __init__(self):
-        # 计算120日移动平均线
-        self.ma120 = bt.indicators.SMA(self.datas[0], period=self.params.ma_period)
+        # 缓存常用数据线，避免每根K线重复查找属性链
+        self._close = self.datas[0].close
+        self._datetime = self.datas[0].datetime
+        
+        # 120日移动平均线：优先使用数据源中预先计算好的均线线（DFAPandasData），
+        # 周期不一致或普通数据源时退回SMA指标
+        data = self.datas[0]
+        if getattr(data.params, 'ma_period', None) == self.params.ma_period:
+            self.ma120 = PrecomputedMA(data, period=self.params.ma_period)
+        else:
+            self.ma120 = bt.indicators.SMA(data, period=self.params.ma_period)
         
         # 投资计数器
         self.investment_count = 0
         self.last_investment_date = None
+        self._last_inv_day = None  # 上次投资的日序号
         
         # 减仓冷却控制
         self.last_profit_taking_date = None
+        self._last_pt_day = None  # 上次减仓的日序号
         
-        # 记录投资历史
-        self.investment_history = []
+        # 记录投资历史（按列预分配数组，_hist_n为已记录条数）
+        max_invs = self.datas[0].buflen() // self.params.investment_interval + 1
+        self._hist_date = np.empty(max_invs, dtype='datetime64[D]')
+        self._hist_price = np.empty(max_invs, dtype=np.float64)
+        self._hist_ma120 = np.empty(max_invs, dtype=np.float64)
+        self._hist_deviation = np.empty(max_invs, dtype=np.float64)
+        self._hist_multiplier = np.empty(max_invs, dtype=np.float64)
+        self._hist_amount = np.empty(max_invs, dtype=np.float64)
+        self._hist_shares = np.empty(max_invs, dtype=np.float64)
+        self._hist_n = 0
+        
+        # 投资统计（随投资累计，stop()时无需再遍历历史）
+        self._sum_dev = 0.0
+        self._sum_mult = 0.0
+        self._sum_amt = 0.0
+        self._max_amt = float('-inf')
+        self._min_amt = float('inf')
         
         # 持仓统计
         self.total_invested = 0.0  # 总投资成本
         self.total_shares = 0.0    # 总持有份额
-        self.profit_history = []   # 利润记录
+        self._has_position = False  # 是否持仓（空仓时跳过减仓检查）
+        self._sell_ratio_e4 = round(self.params.sell_ratio * 10000)  # 减仓比例（万分之一为单位）
+        self._avg_cost = 0.0  # 持仓均价（仅在买入时更新，减仓不改变均价）
+        self._tp_price = float('inf')  # 减仓目标价：持仓均价×(1+目标收益率)
         self.total_sell_amount = 0.0  # 总卖出金额
+        
+        # 减仓记录（与投资历史相同的列数组，_pt_n为已记录条数）
+        max_pts = self.datas[0].buflen() // max(self.params.profit_taking_cooldown, 1) + 1
+        self._pt_date = np.empty(max_pts, dtype='datetime64[D]')
+        self._pt_price = np.empty(max_pts, dtype=np.float64)
+        self._pt_return = np.empty(max_pts, dtype=np.float64)
+        self._pt_shares = np.empty(max_pts, dtype=np.float64)
+        self._pt_amount = np.empty(max_pts, dtype=np.float64)
+        self._pt_cost = np.empty(max_pts, dtype=np.float64)
+        self._pt_n = 0
+        self._sum_profit = 0.0  # 累计已实现利润
+        
+        # 交易日志缓冲区：(日期, 模板, 参数)，在stop()输出时才格式化
+        self._log_buf = []
 
     def next(self):
-        current_date = self.datas[0].datetime.date(0)
+        # 日序号（datetime线的整数部分），避免每根K线构造date对象
+        today = int(self._datetime[0])
+        current_price = self._close[0]
         
-        # 检查减仓条件
-        self.check_profit_taking()
+        # 检查减仓条件（带冷却机制），空仓时直接跳过；
+        # 收益率达到目标等价于价格达到目标价，逐K线只需一次比较
+        if self._has_position and current_price >= self._tp_price:
+            # 检查减仓冷却期（日序号相减即间隔天数）
+            in_cooldown = (self._last_pt_day is not None and
+                           today - self._last_pt_day < self.params.profit_taking_cooldown)
+            
+            # 如果收益率达到目标且不在冷却期内，减仓指定比例
+            if not in_cooldown:
+                # 计算当前收益率
+                current_value = self.total_shares * current_price
+                current_return = (current_value - self.total_invested) / self.total_invested * 100
+                
+                # 允许小数份额卖出：持仓先取整为0.0001份的整数计数再按比例截断，
+                # 避免浮点累加误差（如0.7+0.1）导致少卖一档、留下零头
+                held_e4 = round(self.total_shares * 10000)
+                sell_e4 = held_e4 * self._sell_ratio_e4 // 10000
+                sell_shares = sell_e4 / 10000
+                
+                if sell_e4 > 0:
+                    self._place_sell(sell_shares, current_price)
+                    
+                    # 计算卖出部分的成本和利润
+                    sell_amount = sell_shares * current_price
+                    cost_of_sold = sell_shares * self._avg_cost
+                    profit = sell_amount - cost_of_sold
+                    
+                    # 更新持仓信息
+                    self.total_shares -= sell_shares
+                    self.total_invested -= cost_of_sold
+                    self.total_sell_amount += sell_amount
+                    self._has_position = held_e4 > sell_e4
+                    
+                    # 记录本次减仓日期
+                    current_date = self._datetime.date(0)
+                    self.last_profit_taking_date = current_date
+                    self._last_pt_day = today
+                    
+                    # 记录利润信息
+                    if self._pt_n == len(self._pt_price):
+                        self._grow_history(_PT_COLUMNS)
+                    k = self._pt_n
+                    self._pt_date[k] = current_date
+                    self._pt_price[k] = current_price
+                    self._pt_return[k] = current_return
+                    self._pt_shares[k] = sell_shares
+                    self._pt_amount[k] = sell_amount
+                    self._pt_cost[k] = cost_of_sold
+                    self._pt_n += 1
+                    self._sum_profit += profit
+                    
+                    if self.params.printlog:
+                        self._log_buf.append((current_date, _LOG_SELL, (
+                            current_return, current_price, sell_shares, sell_amount, profit)))
         
-        if self.last_investment_date is None:
+        if self._last_inv_day is None:
             # 第一次投资
-            self.execute_investment()
+            self.execute_investment(today, current_price, self.ma120[0])
             return
             
-        days_since_last = (current_date - self.last_investment_date).days
+        days_since_last = today - self._last_inv_day
         if days_since_last >= self.params.investment_interval:
-            self.execute_investment()
+            self.execute_investment(today, current_price, self.ma120[0])
 
-    def execute_investment(self):
-        """执行动态投资决策"""
-        current_price = self.datas[0].close[0]
-        ma120_value = self.ma120[0]
+    def execute_investment(self, today, current_price, ma120_value):
+        """执行动态投资决策（today为日序号，由next()传入当前K线数据）"""
         
-        # 检查数据是否准备好
-        if ma120_value == 0 or pd.isna(ma120_value):
-            return
-            
-        # 计算偏离度
+        # 计算偏离度（next()受最小周期约束，此时均线必然有效）
         deviation = (current_price - ma120_value) / ma120_value * 100
         
         # 根据偏离度确定投资乘数
@@ -74,131 +244,147 @@ class DFAStrategy(bt.Strategy):
         investment_amount = self.params.base_cash * multiplier
         
         # 确保有足够现金
-        if investment_amount > self.broker.getcash():
-            investment_amount = self.broker.getcash()
+        cash = self._get_cash()
+        if investment_amount > cash:
+            investment_amount = cash
             
         if investment_amount > 0:
-            # 计算购买数量（允许小数，保留4位）
-            size = round(investment_amount / current_price, 4)
+            # 计算购买数量（允许小数，按0.0001份截断，整数运算代替round）
+            size = int(investment_amount / current_price * 10000) / 10000
             
             if size > 0:
                 # 计算实际使用的金额（避免因小数精度损失）
                 actual_invested = size * current_price
                 
-                self.buy(size=size)
+                self._place_buy(size, current_price)
                 
                 # 使用实际买入金额记录成本
                 self.total_invested += actual_invested
                 self.total_shares += size
+                self._has_position = True
+                self._avg_cost = self.total_invested / self.total_shares
+                self._tp_price = self._avg_cost * (1 + self.params.target_return / 100)
                 
                 # 记录投资信息
                 self.investment_count += 1
-                self.last_investment_date = self.datas[0].datetime.date(0)
-                
-                investment_info = {
-                    'date': self.last_investment_date,
-                    'price': current_price,
-                    'ma120': ma120_value,
-                    'deviation': deviation,
-                    'multiplier': multiplier,
-                    'amount': actual_invested,  # 记录实际使用金额
-                    'shares': size
-                }
-                self.investment_history.append(investment_info)
+                self.last_investment_date = self._datetime.date(0)
+                self._last_inv_day = today
                 
-                if self.params.printlog:
-                    self.log(f'第{self.investment_count}期投资: 价格${current_price:.2f}, '
-                           f'偏离度{deviation:.1f}%, 乘数{multiplier:.1f}, '
-                           f'金额${actual_invested:.2f}, 份额{size:.4f}')
-
-    def check_profit_taking(self):
-        """检查减仓条件（带冷却机制）"""
-        if self.total_shares > 0:
-            current_date = self.datas[0].datetime.date(0)
-            current_price = self.datas[0].close[0]
-            current_value = self.total_shares * current_price
-            
-            # 计算当前收益率
-            if self.total_invested > 0:
-                current_return = (current_value - self.total_invested) / self.total_invested * 100
+                if self._hist_n == len(self._hist_price):
+                    self._grow_history(_HIST_COLUMNS)
+                k = self._hist_n
+                self._hist_date[k] = self.last_investment_date
+                self._hist_price[k] = current_price
+                self._hist_ma120[k] = ma120_value
+                self._hist_deviation[k] = deviation
+                self._hist_multiplier[k] = multiplier
+                self._hist_amount[k] = actual_invested  # 记录实际使用金额
+                self._hist_shares[k] = size
+                self._hist_n += 1
                 
-                # 检查减仓冷却期
-                if self.last_profit_taking_date is not None:
-                    days_since_last_taking = (current_date - self.last_profit_taking_date).days
-                    if days_since_last_taking < self.params.profit_taking_cooldown:
-                        return  # 还在冷却期内，不执行减仓
+                self._sum_dev += deviation
+                self._sum_mult += multiplier
+                self._sum_amt += actual_invested
+                self._max_amt = max(self._max_amt, actual_invested)
+                self._min_amt = min(self._min_amt, actual_invested)
                 
-                # 如果收益率达到目标，减仓指定比例
-                if current_return >= self.params.target_return:
-                    # 允许小数份额卖出
-                    sell_shares = round(self.total_shares * self.params.sell_ratio, 4)
-                    
-                    if sell_shares > 0:
-                        self.sell(size=sell_shares)
-                        
-                        # 计算卖出部分的成本和利润
-                        sell_amount = sell_shares * current_price
-                        cost_of_sold = (sell_shares / self.total_shares) * self.total_invested
-                        profit = sell_amount - cost_of_sold
-                        
-                        # 更新持仓信息
-                        self.total_shares -= sell_shares
-                        self.total_invested -= cost_of_sold
-                        self.total_sell_amount += sell_amount
-                        
-                        # 记录本次减仓日期
-                        self.last_profit_taking_date = current_date
-                        
-                        # 记录利润信息
-                        profit_info = {
-                            'date': current_date,
-                            'price': current_price,
-                            'return_percent': current_return,
-                            'shares_sold': sell_shares,
-                            'amount_received': sell_amount,
-                            'cost_of_sold': cost_of_sold,
-                            'profit': profit
-                        }
-                        self.profit_history.append(profit_info)
-                        
-                        if self.params.printlog:
-                            self.log(f'🎯 减仓卖出: 收益率{current_return:.1f}%, '
-                                   f'价格${current_price:.2f}, 卖出{sell_shares:.4f}份额, '
-                                   f'获得${sell_amount:.2f}, 利润${profit:.2f}')
+                if self.params.printlog:
+                    self._log_buf.append((self.last_investment_date, _LOG_INVEST, (
+                        self.investment_count, current_price, deviation, multiplier,
+                        actual_invested, size)))
+
+    @classmethod
+    def run_vectorized(cls, df, initial_cash=None, dtype=np.float64, **kwargs):
+        """
+        用策略参数（可按参数名覆盖，如base_cash=100）运行run_dfa_vectorized。
+        向量化回测按收盘价即时成交、自行记账现金，结果与在backtrader中运行DFAStrategyFast一致；
+        本策略经broker下单（下一根K线开盘价成交），现金不足时定投次数可能不同
+        """
+        p = dict(cls.params._getpairs())
+        unknown = set(kwargs) - set(p)
+        if unknown:
+            raise TypeError(f'未知策略参数: {", ".join(sorted(unknown))}')
+        p.update(kwargs)
+        return run_dfa_vectorized(
+            df,
+            base_cash=p['base_cash'],
+            ma_period=p['ma_period'],
+            interval=p['investment_interval'],
+            target_return=p['target_return'],
+            sell_ratio=p['sell_ratio'],
+            cooldown=p['profit_taking_cooldown'],
+            initial_cash=initial_cash,
+            dtype=dtype,
+        )
+
+    def _get_cash(self):
+        """可用现金（子类可改为自行记账）"""
+        return self.broker.getcash()
+
+    def _place_buy(self, size, price):
+        """按当前K线下买单（price为策略记账使用的收盘价）"""
+        self.buy(size=size)
+
+    def _place_sell(self, size, price):
+        """按当前K线下卖单"""
+        self.sell(size=size)
+
+    def _grow_history(self, names):
+        """历史记录数组容量不足时（如周线数据）扩容一倍"""
+        for name in names:
+            arr = getattr(self, name)
+            grown = np.empty(max(2 * len(arr), 1), dtype=arr.dtype)
+            grown[:len(arr)] = arr
+            setattr(self, name, grown)
+
+    @property
+    def investment_history(self):
+        """投资记录列表（InvestmentRecord，由列数组按需生成）"""
+        n = self._hist_n
+        return list(map(
+            InvestmentRecord,
+            self._hist_date[:n].tolist(), self._hist_price[:n].tolist(),
+            self._hist_ma120[:n].tolist(), self._hist_deviation[:n].tolist(),
+            self._hist_multiplier[:n].tolist(), self._hist_amount[:n].tolist(),
+            self._hist_shares[:n].tolist()))
+
+    @property
+    def profit_history(self):
+        """减仓记录列表（字典，由列数组按需生成）"""
+        n = self._pt_n
+        amount = self._pt_amount[:n]
+        cost = self._pt_cost[:n]
+        return [
+            {
+                'date': date,
+                'price': price,
+                'return_percent': ret,
+                'shares_sold': shares,
+                'amount_received': amt,
+                'cost_of_sold': cst,
+                'profit': pft,
+            }
+            for date, price, ret, shares, amt, cst, pft in zip(
+                self._pt_date[:n].tolist(), self._pt_price[:n].tolist(),
+                self._pt_return[:n].tolist(), self._pt_shares[:n].tolist(),
+                amount.tolist(), cost.tolist(), (amount - cost).tolist())
+        ]
 
     def get_investment_multiplier(self, deviation):
         """根据偏离度返回投资乘数"""
-        if deviation <= -20:    # 极度低估
-            return 2.2
-        elif deviation <= -10:  # 显著低估
-            return 1.8
-        elif deviation <= 0:    # 正常偏低
-            return 1.4
-        elif deviation <= 5:    # 正常估值
-            return 1.0
-        elif deviation <= 15:   # 正常偏高
-            return 0.5
-        elif deviation <= 25:   # 显著高估
-            return 0.2
-        else:                   # 极度高估
-            return 0.0
+        return _DEV_MULTS_T[bisect.bisect_left(_DEV_BOUNDS_T, deviation)]
 
     def log(self, txt, dt=None):
-        '''日志函数'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print(f'{dt.isoformat()}: {txt}')
+        '''日志函数（先写入缓冲区，stop()时统一输出，不受printlog限制）'''
+        self._log_buf.append((dt or self._datetime.date(0), '%s', (txt,)))
 
-    def stop(self):
-        """策略结束时的分析"""
-        print('\n' + '='*60)
-        print('📊 DFA策略回测详细报告 (基于实际投资成本)')
-        print('='*60)
-        
-        # 计算基于实际投资成本的财务数据
+    def get_summary(self):
+        """基于实际投资成本的回测汇总"""
+        n = self._hist_n
         current_holdings_value = round(self.total_shares * self.datas[0].close[0], 2)
-        total_realized_profit = sum([p['profit'] for p in self.profit_history])
+        total_realized_profit = self._sum_profit
         total_assets_from_investment = current_holdings_value + self.total_sell_amount
-        total_investment = sum([inv['amount'] for inv in self.investment_history])
+        total_investment = self._sum_amt
         
         # 基于实际投资的总回报率
         if total_investment > 0:
@@ -206,6 +392,51 @@ class DFAStrategy(bt.Strategy):
         else:
             total_return_percent = 0
         
+        # 计算年化回报率
+        annual_return = None
+        if n:
+            first_date = self._hist_date[0].item()
+            last_date = self.datas[0].datetime.date(0)
+            days_total = (last_date - first_date).days
+            years_total = days_total / 365.25
+            
+            if years_total > 0:
+                annual_return = ((1 + total_return_percent/100) ** (1/years_total) - 1) * 100
+        
+        return {
+            'investment_count': self.investment_count,
+            'total_investment': total_investment,
+            'position_cost': self.total_invested,
+            'holdings_value': current_holdings_value,
+            'realized_profit': total_realized_profit,
+            'total_sell_amount': self.total_sell_amount,
+            'total_assets': total_assets_from_investment,
+            'return_percent': total_return_percent,
+            'annual_return': annual_return,
+            'profit_taking_count': self._pt_n,
+        }
+
+    def stop(self):
+        """策略结束时的分析（printlog关闭时不输出报告，如参数扫描）"""
+        # 缓冲的日志总是输出：交易日志仅在printlog开启时写入，直接调用log()的内容与原先一样不受其限制
+        if self._log_buf:
+            sys.stdout.write('\n'.join('%s: %s' % (dt.isoformat(), fmt % args)
+                                       for dt, fmt, args in self._log_buf))
+            sys.stdout.write('\n')
+            self._log_buf.clear()
+        
+        if not self.params.printlog:
+            return
+        
+        print('\n' + '='*60)
+        print('📊 DFA策略回测详细报告 (基于实际投资成本)')
+        print('='*60)
+        
+        summary = self.get_summary()
+        n = self._hist_n
+        total_investment = summary['total_investment']
+        current_holdings_value = summary['holdings_value']
+        
         print(f'总定投期数: {self.investment_count}')
         print(f'当前持仓价值: ${current_holdings_value:.2f}')
         
@@ -213,70 +444,375 @@ class DFAStrategy(bt.Strategy):
         print(f'  实际总投资: ${total_investment:.2f}')
         print(f'  当前持仓成本: ${self.total_invested:.2f}')
         print(f'  当前持仓价值: ${current_holdings_value:.2f}')
-        print(f'  已实现利润: ${total_realized_profit:.2f}')
+        print(f'  已实现利润: ${summary["realized_profit"]:.2f}')
         print(f'  总卖出金额: ${self.total_sell_amount:.2f}')
-        print(f'  总资产(投资产生): ${total_assets_from_investment:.2f}')
-        print(f'  基于投资的总回报率: {total_return_percent:.2f}%')
-        
-        # 计算年化回报率
-        if self.investment_history:
-            first_date = self.investment_history[0]['date']
-            last_date = self.datas[0].datetime.date(0)
-            days_total = (last_date - first_date).days
-            years_total = days_total / 365.25
-            
-            if years_total > 0:
-                annual_return = ((1 + total_return_percent/100) ** (1/years_total) - 1) * 100
-                print(f'  年化回报率: {annual_return:.2f}%')
+        print(f'  总资产(投资产生): ${summary["total_assets"]:.2f}')
+        print(f'  基于投资的总回报率: {summary["return_percent"]:.2f}%')
+        if summary['annual_return'] is not None:
+            print(f'  年化回报率: {summary["annual_return"]:.2f}%')
         
         # 投资历史概览
-        if self.investment_history:
-            df = pd.DataFrame(self.investment_history)
+        if n:
             print(f"\n📈 投资历史概览:")
-            print(f"  平均偏离度: {df['deviation'].mean():.1f}%")
-            print(f"  平均投资乘数: {df['multiplier'].mean():.2f}")
-            print(f"  总投资金额: ${df['amount'].sum():.2f}")
-            print(f"  最大单次投资: ${df['amount'].max():.2f}")
-            print(f"  最小单次投资: ${df['amount'].min():.2f}")
+            print(f"  平均偏离度: {self._sum_dev / n:.1f}%")
+            print(f"  平均投资乘数: {self._sum_mult / n:.2f}")
+            print(f"  总投资金额: ${self._sum_amt:.2f}")
+            print(f"  最大单次投资: ${self._max_amt:.2f}")
+            print(f"  最小单次投资: ${self._min_amt:.2f}")
         
         # 减仓记录
-        if self.profit_history:
+        if self._pt_n:
             print(f"\n🎯 减仓记录 (冷却期{self.params.profit_taking_cooldown}天):")
-            total_sold_amount = 0
-            total_profit = 0
             
-            for i, profit in enumerate(self.profit_history, 1):
-                print(f"  第{i}次减仓: {profit['date']}")
-                print(f"    └─ 收益率: {profit['return_percent']:.1f}%")
-                print(f"    └─ 价格: ${profit['price']:.2f}")
-                print(f"    └─ 卖出金额: ${profit['amount_received']:.2f}")
-                print(f"    └─ 对应成本: ${profit['cost_of_sold']:.2f}")
-                print(f"    └─ 利润: ${profit['profit']:.2f}")
-                
-                total_sold_amount += profit['amount_received']
-                total_profit += profit['profit']
+            # 直接按列遍历，不生成减仓记录字典
+            m = self._pt_n
+            amount = self._pt_amount[:m]
+            cost = self._pt_cost[:m]
+            records = zip(self._pt_date[:m].tolist(), self._pt_return[:m].tolist(),
+                          self._pt_price[:m].tolist(), amount.tolist(), cost.tolist(),
+                          (amount - cost).tolist())
+            for i, (date, ret, price, amt, cst, pft) in enumerate(records, 1):
+                print(f"  第{i}次减仓: {date}")
+                print(f"    └─ 收益率: {ret:.1f}%")
+                print(f"    └─ 价格: ${price:.2f}")
+                print(f"    └─ 卖出金额: ${amt:.2f}")
+                print(f"    └─ 对应成本: ${cst:.2f}")
+                print(f"    └─ 利润: ${pft:.2f}")
             
+            total_profit = self._sum_profit
             print(f"\n  💰 减仓统计:")
-            print(f"    总减仓次数: {len(self.profit_history)}")
-            print(f"    总卖出金额: ${total_sold_amount:.2f}")
+            print(f"    总减仓次数: {self._pt_n}")
+            print(f"    总卖出金额: ${self.total_sell_amount:.2f}")
             print(f"    总实现利润: ${total_profit:.2f}")
             if total_investment > 0:
                 profit_ratio = (total_profit / total_investment) * 100
                 print(f"    利润/投资比: {profit_ratio:.2f}%")
 
-def run_dfa_binance_backtest(symbol='SOLUSDT', timeframe='1d', data_limit=1000):
-    """使用币安数据运行DFA策略回测"""
+class DFAStrategyFast(DFAStrategy):
+    """
+    不经过backtrader下单/撮合的DFA策略：现金以浮点数自行记账（份额即total_shares），按收盘价即时成交
+    （与向量化回测的口径一致）。现金不足时结果与经broker下单的DFAStrategy不同，
+    需显式选用（各回测函数的fast参数）；
+    broker_orders=True时仍走真实下单，以便cerebro.plot画出买卖点
+    """
+    
+    params = (
+        # 是否仍通过broker真实下单（绘图时开启；不能命名为plot，会被plotinfo参数截获）
+        ('broker_orders', False),
+    )
     
-    # 创建cerebro引擎
-    cerebro = bt.Cerebro()
+    def __init__(self):
+        super().__init__()
+        self._cash = self.broker.startingcash
+
+    def _get_cash(self):
+        if self.params.broker_orders:
+            return super()._get_cash()
+        return self._cash
+
+    def _place_buy(self, size, price):
+        if self.params.broker_orders:
+            return super()._place_buy(size, price)
+        self._cash -= size * price
+
+    def _place_sell(self, size, price):
+        if self.params.broker_orders:
+            return super()._place_sell(size, price)
+        self._cash += size * price
+
+class ReplayStrategy(bt.Strategy):
+    """
+    回放预先计算好的交易计划（compute_plan_vectorized的结果），
+    不计算指标，只在计划中的K线下单，用于借助backtrader绘图和分析器。
+    计划按下单K线收盘价成交计算，回放时broker需设置set_coc(True)；
+    订单因现金不足被拒时在stop()中提示（最后一根K线上的订单没有后续K线撮合，不会成交）
+    """
     
-    # 设置更合理的初始资金（基于预计投资）
-    estimated_periods = 30
-    initial_cash = 70 * estimated_periods * 3  # 预留足够现金
-    cerebro.broker.setcash(initial_cash)
+    params = (
+        ('plan', None),  # PLAN_DTYPE结构化数组
+    )
+    
+    def __init__(self):
+        plan = self.params.plan
+        self._bars = plan['bar'].tolist()
+        self._actions = plan['action'].tolist()
+        self._sizes = plan['size'].tolist()
+        self._k = 0
+        self._rejected = 0
+
+    def notify_order(self, order):
+        if order.status in (order.Margin, order.Rejected):
+            self._rejected += 1
+
+    def next(self):
+        i = len(self) - 1
+        while self._k < len(self._bars) and self._bars[self._k] == i:
+            if self._actions[self._k] == ACTION_BUY:
+                self.buy(size=self._sizes[self._k])
+            else:
+                self.sell(size=self._sizes[self._k])
+            self._k += 1
+
+    def stop(self):
+        if self._rejected:
+            print(f'⚠️ 回放交易计划: {len(self._bars)}笔中{self._rejected}笔因现金不足被拒，'
+                  f'图表买卖点与回测结果不完全一致')
+
+class DFAAnalyzer(bt.Analyzer):
+    """收集DFAStrategy.get_summary()的结果（optreturn模式下策略对象不返回，需经分析器带出）"""
+    
+    def stop(self):
+        self.rets.update(self.strategy.get_summary())
+
+@njit(cache=True)
+def _dfa_simulate(close, mult, days, start, base_cash, interval, target_return,
+                  sell_ratio, cooldown, cash):
+    """
+    DFA逐K线状态机，逻辑与DFAStrategy.next()一致：
+    同一根K线先检查减仓再检查定投，按收盘价即时成交、自行记账现金（即DFAStrategyFast的口径）。
+    返回买入/减仓事件数组（前nb/ns项有效）及最终持仓状态。
+    """
+    n = close.shape[0]
+    # 每根K线至多一次买入、一次减仓，按均线就绪后的K线数预分配
+    cap = max(n - start, 0)
+    buy_bar = np.empty(cap, dtype=np.int64)
+    buy_shares = np.empty(cap)
+    buy_amount = np.empty(cap)
+    sell_bar = np.empty(cap, dtype=np.int64)
+    sell_shares = np.empty(cap)
+    sell_amount = np.empty(cap)
+    sell_cost = np.empty(cap)
+    sell_return = np.empty(cap)
+    nb = 0
+    ns = 0
+
+    total_invested = 0.0
+    total_shares = 0.0
+    total_sell_amount = 0.0
+    avg_cost = 0.0
+    tp_price = np.inf
+    has_pos = False
+    sell_ratio_e4 = int(round(sell_ratio * 10000.0))
+    has_inv = False
+    last_inv_day = 0
+    has_pt = False
+    last_pt_day = 0
+
+    for i in range(start, n):
+        price = float(close[i])
+
+        # 检查减仓条件（带冷却机制），价格达到目标价即收益率达到目标
+        if has_pos and price >= tp_price:
+            if not has_pt or days[i] - last_pt_day >= cooldown:
+                current_return = (total_shares * price - total_invested) / total_invested * 100
+                # 持仓按0.0001份取整后再按比例截断（与DFAStrategy.next()一致）
+                held_e4 = int(round(total_shares * 10000.0))
+                sell_e4 = held_e4 * sell_ratio_e4 // 10000
+                size = sell_e4 / 10000.0
+                if sell_e4 > 0:
+                    amount = size * price
+                    cost_of_sold = size * avg_cost
+                    total_shares -= size
+                    total_invested -= cost_of_sold
+                    total_sell_amount += amount
+                    cash += amount
+                    has_pos = held_e4 > sell_e4
+                    has_pt = True
+                    last_pt_day = days[i]
+
+                    sell_bar[ns] = i
+                    sell_shares[ns] = size
+                    sell_amount[ns] = amount
+                    sell_cost[ns] = cost_of_sold
+                    sell_return[ns] = current_return
+                    ns += 1
+
+        # 检查定投条件
+        if not has_inv or days[i] - last_inv_day >= interval:
+            investment_amount = min(base_cash * float(mult[i]), cash)
+            if investment_amount > 0:
+                size = int(investment_amount / price * 10000.0) / 10000.0
+                if size > 0:
+                    actual_invested = size * price
+                    total_invested += actual_invested
+                    total_shares += size
+                    has_pos = True
+                    avg_cost = total_invested / total_shares
+                    tp_price = avg_cost * (1 + target_return / 100)
+                    cash -= actual_invested
+                    has_inv = True
+                    last_inv_day = days[i]
+
+                    buy_bar[nb] = i
+                    buy_shares[nb] = size
+                    buy_amount[nb] = actual_invested
+                    nb += 1
+
+    return (buy_bar[:nb], buy_shares[:nb], buy_amount[:nb],
+            sell_bar[:ns], sell_shares[:ns], sell_amount[:ns], sell_cost[:ns], sell_return[:ns],
+            total_invested, total_shares, total_sell_amount)
+
+def _rolling_mean(values, period):
+    """
+    滑动平均：窗口和由前缀和相减得到，即 V[t] = V[t-1] + (S[t] - S[t-period]) / period，
+    整列O(n)一次算完；前period-1项为nan
+    """
+    if bn is not None and len(values) >= period:
+        # bottleneck的C实现逐项维护窗口和，float64累加后转回原精度
+        return bn.move_mean(values.astype(np.float64, copy=False), period,
+                            min_count=period).astype(values.dtype, copy=False)
+    out = np.full(len(values), np.nan, dtype=values.dtype)
+    if len(values) >= period:
+        csum = np.cumsum(values, dtype=np.float64)
+        window = csum[period - 1:].copy()
+        window[1:] -= csum[:-period]
+        out[period - 1:] = window / period
+    return out
+
+def _simulate_frame(df, base_cash, ma_period, interval, target_return, sell_ratio, cooldown,
+                    initial_cash, dtype):
+    """对整列计算均线/偏离度/乘数并运行状态机，返回(close, ma, dev, mult, 状态机结果)"""
+    close = df['close'].to_numpy(dtype=dtype)
+    ma = _rolling_mean(close, ma_period)
+    dev = (close - ma) / ma * 100
+    mult = _DEV_MULTS.astype(dtype, copy=False)[np.searchsorted(_DEV_BOUNDS, dev)]
+    # 日序号，与backtrader中按日期相减的天数一致
+    days = df.index.to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    cash = np.inf if initial_cash is None else float(initial_cash)
+    sim = _dfa_simulate(
+        close, mult, days, ma_period - 1, float(base_cash), interval,
+        float(target_return), float(sell_ratio), cooldown, cash)
+    return close, ma, dev, mult, sim
+
+def _build_plan(buy_bar, buy_shares, sell_bar, sell_shares):
+    """合并买卖事件为按K线排序的交易计划（同一K线先卖后买，与策略执行顺序一致）"""
+    plan = np.empty(len(sell_bar) + len(buy_bar), dtype=PLAN_DTYPE)
+    plan['bar'][:len(sell_bar)] = sell_bar
+    plan['action'][:len(sell_bar)] = ACTION_SELL
+    plan['size'][:len(sell_bar)] = sell_shares
+    plan['bar'][len(sell_bar):] = buy_bar
+    plan['action'][len(sell_bar):] = ACTION_BUY
+    plan['size'][len(sell_bar):] = buy_shares
+    return plan[np.argsort(plan['bar'], kind='stable')]
+
+def compute_plan_vectorized(df, base_cash=70, ma_period=120, interval=14, target_return=75,
+                            sell_ratio=0.5, cooldown=30, initial_cash=None, dtype=np.float64):
+    """
+    只计算交易计划（参数同run_dfa_vectorized），供ReplayStrategy回放
+    返回PLAN_DTYPE结构化数组：bar为K线序号（从0开始），action为ACTION_BUY/ACTION_SELL，size为份额
+    """
+    sim = _simulate_frame(df, base_cash, ma_period, interval, target_return, sell_ratio, cooldown,
+                          initial_cash, dtype)[4]
+    return _build_plan(sim[0], sim[1], sim[3], sim[4])
+
+def run_dfa_vectorized(df, base_cash=70, ma_period=120, interval=14, target_return=75,
+                       sell_ratio=0.5, cooldown=30, initial_cash=None, dtype=np.float64):
+    """
+    向量化DFA回测（不经过backtrader事件循环）
+    偏离度/乘数对整列一次性计算，买卖状态机由_dfa_simulate完成（安装numba时JIT编译）。
+    df: fetch_binance_data返回的K线数据
+    initial_cash: 可用现金上限，None表示不限制
+    dtype: 价格/均线/乘数数组的精度。np.float32内存占用减半，适合长序列参数扫描，
+           但只有约7位有效数字（BTC等高价币种会损失到分），金额统计仍以float64累计
+    返回结果字典，其中plan为可交给ReplayStrategy回放的交易计划
+    """
+    close, ma, dev, mult, sim = _simulate_frame(
+        df, base_cash, ma_period, interval, target_return, sell_ratio, cooldown, initial_cash, dtype)
+    (buy_bar, buy_shares, buy_amount,
+     sell_bar, sell_shares, sell_amount, sell_cost, sell_return,
+     total_invested, total_shares, total_sell_amount) = sim
+    n = len(close)
+    # 只对成交K线取日期和指标值，按列一次转换为Python对象
+    stamps = df.index.to_numpy()
+    investment_history = list(map(
+        InvestmentRecord,
+        stamps[buy_bar].astype('datetime64[D]').tolist(), close[buy_bar].tolist(),
+        ma[buy_bar].tolist(), dev[buy_bar].tolist(), mult[buy_bar].tolist(),
+        buy_amount.tolist(), buy_shares.tolist()))
+
+    profit_history = [
+        {
+            'date': date,
+            'price': price,
+            'return_percent': ret,
+            'shares_sold': shares,
+            'amount_received': amt,
+            'cost_of_sold': cst,
+            'profit': pft,
+        }
+        for date, price, ret, shares, amt, cst, pft in zip(
+            stamps[sell_bar].astype('datetime64[D]').tolist(), close[sell_bar].tolist(),
+            sell_return.tolist(), sell_shares.tolist(), sell_amount.tolist(),
+            sell_cost.tolist(), (sell_amount - sell_cost).tolist())
+    ]
+
+    return {
+        'investment_history': investment_history,
+        'profit_history': profit_history,
+        'investment_count': len(investment_history),
+        'total_invested': total_invested,
+        'total_shares': total_shares,
+        'total_sell_amount': total_sell_amount,
+        'last_price': float(close[-1]) if n else 0.0,
+        'plan': _build_plan(buy_bar, buy_shares, sell_bar, sell_shares),
+    }
+
+class DFAPandasData(bt.feeds.PandasDirectData):
+    """
+    附带预先计算的移动平均线（ma120线）的数据源
+    逐行遍历itertuples，参数为各列在元组中的位置（0为时间索引）
+    """
+    lines = ('ma120',)
+    params = (
+        ('openinterest', -1),
+        ('ma120', 6),
+        ('ma_period', None),  # ma120列对应的均线周期，与策略参数一致时策略直接使用
+    )
+
+    def preload(self):
+        super().preload()
+        # 预加载完成后释放itertuples迭代器：optstrategy多进程时数据源需可pickle
+        self._rows = None
+
+class PrecomputedMA(bt.Indicator):
+    """
+    直接引用DFAPandasData中预先计算的均线，不做任何计算
+    声明与SMA相同的最小周期，使策略的next()只在均线有效后执行
+    """
+    lines = ('ma120',)
+    params = (('period', 120),)
+    plotinfo = dict(subplot=False)
+
+    def __init__(self):
+        self.addminperiod(self.params.period)
+
+    def next(self):
+        self.lines.ma120[0] = self.data.ma120[0]
+
+    def once(self, start, end):
+        self.lines.ma120.array[start:end] = self.data.ma120.array[start:end]
+
+def make_data_feed(data_df, ma_period=120):
+    """创建Backtrader数据源（一次性计算移动平均线作为ma120线）"""
+    # 按列引用原数组组装（列顺序即DFAPandasData中的位置参数），只在合并时复制一次
+    cols = {c: data_df[c].to_numpy(dtype=np.float64)
+            for c in ('open', 'high', 'low', 'close', 'volume')}
+    cols['ma120'] = _rolling_mean(cols['close'], ma_period)
+    frame = pd.DataFrame(cols, index=data_df.index, copy=False)
+    return DFAPandasData(dataname=frame, ma_period=ma_period)
+
+def run_dfa_binance_backtest(symbol='SOLUSDT', timeframe='1d', data_limit=1000, vectorized=False,
+                             plot=True, fast=False):
+    """
+    使用币安数据运行DFA策略回测，返回结果汇总字典（获取数据失败时返回None）
+    vectorized: 为True时使用run_dfa_vectorized计算结果，绘图时由ReplayStrategy回放交易计划
+    plot: 是否绘制图表（多进程运行时需关闭；设置DFA_HEADLESS=1时始终跳过）
+    fast: 不绘图时改用DFAStrategyFast（按收盘价成交、自行记账现金，与向量化回测口径一致；
+          现金不足时结果与默认的broker下单方式不同）
+    """
     
-    # 添加策略
-    cerebro.addstrategy(DFAStrategy)
+    initial_cash = DEFAULT_INITIAL_CASH
     
     # 从币安获取数据
     data_df = fetch_binance_data(symbol, timeframe, data_limit)
@@ -285,41 +821,53 @@ def run_dfa_binance_backtest(symbol='SOLUSDT', timeframe='1d', data_limit=1000):
         print(f"无法获取 {symbol} 数据，退出回测")
         return
     
-    # 创建Backtrader数据源
-    data = bt.feeds.PandasData(
-        dataname=data_df,
-        datetime=None,
-        open='open',
-        high='high', 
-        low='low',
-        close='close',
-        volume='volume',
-        openinterest=None
-    )
-    
-    cerebro.adddata(data)
-    
-    # 添加分析器
-    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+    print(f'初始现金储备: ${initial_cash:.2f}')
     
-    print(f'初始现金储备: ${cerebro.broker.getvalue():.2f}')
-    
-    # 运行回测
-    print('开始回测...')
-    results = cerebro.run()
-    strat = results[0]
+    if vectorized:
+        print('开始向量化回测...')
+        result = DFAStrategy.run_vectorized(data_df, initial_cash=initial_cash)
+        investment_count = result['investment_count']
+        profit_taking_count = len(result['profit_history'])
+        total_investment = sum(inv.amount for inv in result['investment_history'])
+        realized_profit = sum(p['profit'] for p in result['profit_history'])
+        total_shares = result['total_shares']
+        total_sell_amount = result['total_sell_amount']
+        last_price = result['last_price']
+    else:
+        # 创建cerebro引擎（不绘图时关闭默认观察器，结果全部来自策略自身统计）
+        draw = plot and not HEADLESS
+        cerebro = bt.Cerebro(stdstats=draw)
+        cerebro.broker.setcash(initial_cash)
+        
+        # 添加策略（显式要求fast且不绘图时才使用自行记账的DFAStrategyFast）
+        if fast and not draw:
+            cerebro.addstrategy(DFAStrategyFast)
+        else:
+            cerebro.addstrategy(DFAStrategy)
+        
+        cerebro.adddata(make_data_feed(data_df))
+        
+        # 运行回测
+        print('开始回测...')
+        results = cerebro.run()
+        strat = results[0]
+        
+        # 从策略中获取实际投资数据（总投资与已实现利润已在回测中累计）
+        summary = strat.get_summary()
+        investment_count = strat.investment_count
+        profit_taking_count = summary['profit_taking_count']
+        total_investment = summary['total_investment']
+        realized_profit = summary['realized_profit']
+        total_shares = strat.total_shares
+        total_sell_amount = strat.total_sell_amount
+        last_price = strat.datas[0].close[0]
     
     # 输出基于实际投资的结果
     print('\n' + '='*60)
     print('DFA策略回测结果 (基于实际投资成本)')
     print('='*60)
     
-    # 从策略中获取实际投资数据
-    total_investment = sum([inv['amount'] for inv in strat.investment_history])
-    total_assets_from_investment = (strat.total_shares * strat.datas[0].close[0]) + strat.total_sell_amount
+    total_assets_from_investment = (total_shares * last_price) + total_sell_amount
     
     if total_investment > 0:
         actual_return = ((total_assets_from_investment - total_investment) / total_investment) * 100
@@ -329,55 +877,263 @@ def run_dfa_binance_backtest(symbol='SOLUSDT', timeframe='1d', data_limit=1000):
     print(f'实际总投资: ${total_investment:.2f}')
     print(f'投资产生总资产: ${total_assets_from_investment:.2f}')
     print(f'基于投资的总回报率: {actual_return:.2f}%')
-    print(f'总定投期数: {strat.investment_count}')
-    print(f'减仓次数: {len(strat.profit_history)}')
-    print(f'已实现利润: ${sum([p["profit"] for p in strat.profit_history]):.2f}')
+    print(f'总定投期数: {investment_count}')
+    print(f'减仓次数: {profit_taking_count}')
+    print(f'已实现利润: ${realized_profit:.2f}')
+    
+    if plot and not HEADLESS:
+        if vectorized:
+            # 回放向量化交易计划，只为生成买卖点图表（按下单K线收盘价成交，与计划口径一致）
+            cerebro = bt.Cerebro()
+            cerebro.broker.setcash(initial_cash)
+            cerebro.broker.set_coc(True)
+            cerebro.addstrategy(ReplayStrategy, plan=result['plan'])
+            cerebro.adddata(make_data_feed(data_df))
+            cerebro.run()
+        
+        # 绘制图表
+        print('\n生成图表...')
+        cerebro.plot(style='candlestick', volume=False)
+    
+    return {
+        'symbol': symbol,
+        'total_investment': total_investment,
+        'total_assets': total_assets_from_investment,
+        'return_percent': actual_return,
+        'investment_count': investment_count,
+        'profit_taking_count': profit_taking_count,
+        'realized_profit': realized_profit,
+    }
+
+def run_dfa_sweep(symbol, param_grid, timeframe='1d', data_limit=1000, maxcpus=None, fast=False):
+    """
+    单币种参数扫描：数据只获取一次，由cerebro.optstrategy多进程运行全部参数组合
+    param_grid: {参数名: [取值, ...]}，如 {'base_cash': [50, 70], 'target_return': [50, 75]}
+    fast: 使用DFAStrategyFast（口径见run_dfa_binance_backtest）
+    返回按总回报率降序排列的 [{'params': {...}, **汇总}, ...]
+    """
+    data_df = fetch_binance_data(symbol, timeframe, data_limit)
+    
+    if data_df is None or data_df.empty:
+        print(f"无法获取 {symbol} 数据，退出参数扫描")
+        return
+    
+    cerebro = bt.Cerebro(optreturn=True, stdstats=False, maxcpus=maxcpus or os.cpu_count())
+    cerebro.broker.setcash(DEFAULT_INITIAL_CASH)
+    strategy = DFAStrategyFast if fast else DFAStrategy
+    cerebro.optstrategy(strategy, printlog=False, **param_grid)
+    cerebro.adddata(make_data_feed(data_df))
+    cerebro.addanalyzer(DFAAnalyzer, _name='dfa')
+    
+    print(f'开始参数扫描: {symbol}')
+    results = []
+    for run in cerebro.run():
+        opt = run[0]
+        summary = dict(opt.analyzers.dfa.get_analysis())
+        summary['params'] = {name: getattr(opt.params, name) for name in param_grid}
+        results.append(summary)
+    results.sort(key=lambda r: r['return_percent'], reverse=True)
+    
+    print('\n' + '='*60)
+    print(f'📊 {symbol} 参数扫描结果 (共{len(results)}组)')
+    print('='*60)
+    for res in results:
+        params = ', '.join(f'{k}={v}' for k, v in res['params'].items())
+        print(f"{params}: 总投资${res['total_investment']:.2f}, "
+              f"总回报率{res['return_percent']:.2f}%, 减仓{res['profit_taking_count']}次")
     
-    # 绘制图表
-    print('\n生成图表...')
-    cerebro.plot(style='candlestick', volume=False)
+    return results
 
-def fetch_binance_data(symbol='SOLUSDT', timeframe='1d', limit=1000):
+def test_multiple_crypto_assets(crypto_assets=None, timeframe='1d', data_limit=500):
+    """
+    多币种并行回测，每个币种在独立进程中运行（不绘图）
+    crypto_assets: [(交易对, 名称), ...]
+    """
+    if crypto_assets is None:
+        crypto_assets = [
+            ('BTCUSDT', '比特币'),
+            ('ETHUSDT', '以太坊'),
+            ('SOLUSDT', 'Solana'),
+            ('SUIUSDT', 'Sui'),
+        ]
+    
+    results = {}
+    max_workers = min(len(crypto_assets), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futs = {ex.submit(run_dfa_binance_backtest, symbol, timeframe, data_limit, plot=False): symbol
+                for symbol, name in crypto_assets}
+        for fut in as_completed(futs):
+            symbol = futs[fut]
+            try:
+                results[symbol] = fut.result()
+            except Exception as e:
+                print(f"{symbol} 回测失败: {e}")
+                results[symbol] = None
+    
+    print('\n' + '='*60)
+    print('📊 多币种回测对比')
+    print('='*60)
+    for symbol, name in crypto_assets:
+        res = results.get(symbol)
+        if res is None:
+            print(f'{name}({symbol}): 无结果')
+            continue
+        print(f"{name}({symbol}): 总投资${res['total_investment']:.2f}, "
+              f"总回报率{res['return_percent']:.2f}%, 定投{res['investment_count']}期, "
+              f"减仓{res['profit_taking_count']}次, 已实现利润${res['realized_profit']:.2f}")
+    
+    return results
+
+# 参数网格工作进程中的K线数据 {交易对: DataFrame}，由_init_grid_worker在进程启动时设置
+_GRID_DATA = {}
+
+def _init_grid_worker(frames):
+    """网格回测工作进程初始化：每个进程只接收一次全部K线数据"""
+    global _GRID_DATA
+    _GRID_DATA = frames
+
+def _run_grid_task(symbol, params, fast):
+    """在工作进程已加载的数据上运行一次DFA回测（不输出日志、不绘图），返回汇总字典"""
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(DEFAULT_INITIAL_CASH)
+    cerebro.addstrategy(DFAStrategyFast if fast else DFAStrategy, printlog=False, **params)
+    cerebro.adddata(make_data_feed(_GRID_DATA[symbol], params.get('ma_period', 120)))
+    summary = cerebro.run()[0].get_summary()
+    summary['symbol'] = symbol
+    summary['params'] = params
+    return summary
+
+def run_dfa_grid(symbols, param_grid, timeframe='1d', data_limit=1000, max_workers=None,
+                 fast=False):
+    """
+    多币种×多参数网格回测：数据在主进程并发获取一次，(交易对, 参数组合)逐个分发到进程池
+    symbols: 交易对列表，如 ['BTCUSDT', 'SOLUSDT']
+    param_grid: {参数名: [取值, ...]}，与run_dfa_sweep相同
+    fast: 使用DFAStrategyFast（口径见run_dfa_binance_backtest）
+    返回每个交易对内按总回报率降序排列的 [{'symbol': ..., 'params': {...}, **汇总}, ...]
+    """
+    # 各币种数据在线程中并发获取（线程数有上限，每个线程使用自己的HTTP会话）
+    with ThreadPoolExecutor(max_workers=max(min(len(symbols), FETCH_MAX_WORKERS), 1)) as ex:
+        fetched = list(ex.map(lambda symbol: fetch_binance_data(symbol, timeframe, data_limit),
+                              symbols))
+    
+    frames = {}
+    for symbol, data_df in zip(symbols, fetched):
+        if data_df is None or data_df.empty:
+            print(f"无法获取 {symbol} 数据，跳过")
+            continue
+        frames[symbol] = data_df
+    
+    names = list(param_grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+    tasks = [(symbol, params) for symbol in frames for params in combos]
+    
+    print(f'开始网格回测: {len(frames)}个币种 × {len(combos)}组参数')
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                             initializer=_init_grid_worker, initargs=(frames,)) as ex:
+        futs = {ex.submit(_run_grid_task, symbol, params, fast): (symbol, params)
+                for symbol, params in tasks}
+        for fut in as_completed(futs):
+            symbol, params = futs[fut]
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                print(f"{symbol} {params} 回测失败: {e}")
+    
+    order = {symbol: i for i, symbol in enumerate(frames)}
+    results.sort(key=lambda r: (order[r['symbol']], -r['return_percent']))
+    
+    print('\n' + '='*60)
+    print(f'📊 网格回测结果 (共{len(results)}组)')
+    print('='*60)
+    for res in results:
+        params = ', '.join(f'{k}={v}' for k, v in res['params'].items())
+        print(f"{res['symbol']} {params}: 总投资${res['total_investment']:.2f}, "
+              f"总回报率{res['return_percent']:.2f}%, 减仓{res['profit_taking_count']}次")
+    
+    return results
+
+_SESSION_LOCAL = threading.local()
+
+def _get_session():
+    """
+    当前线程的HTTP会话（复用连接，避免每次请求重新握手）
+    requests.Session不保证线程安全，每个线程（及每个进程）各自创建
+    """
+    session = getattr(_SESSION_LOCAL, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.proxies.update(PROXIES)
+        _SESSION_LOCAL.session = session
+    return session
+
+def fetch_binance_data(symbol='SOLUSDT', timeframe='1d', limit=1000, use_cache=True,
+                       cache_ttl=CACHE_TTL):
     """
     从币安获取K线数据
     symbol: 交易对，如 SOLUSDT, BTCUSDT, ETHUSDT
     timeframe: 时间周期 1d=日线, 1h=1小时, 1w=周线
     limit: 获取的数据条数
+    use_cache: 是否使用本地缓存（parquet文件，按交易对/周期/条数区分）
+    cache_ttl: 缓存有效期（秒），超时后重新获取并覆盖
     """
+    cache_path = os.path.join(CACHE_DIR, f'{symbol}_{timeframe}_{limit}.parquet')
+    if (use_cache and os.path.exists(cache_path)
+            and time.time() - os.path.getmtime(cache_path) < cache_ttl):
+        try:
+            df = pd.read_parquet(cache_path)
+            print(f"从缓存读取 {len(df)} 条 {symbol} 数据: {cache_path}")
+            return df
+        except Exception as e:
+            print(f"读取缓存失败，重新获取: {e}")
+
     print(f"正在从币安获取 {symbol} 数据...")
 
-    exchange = ccxt.binance({
-        'enableRateLimit': True,
-        'proxies': {
-            'http': 'http://10.48.175.246:7897',
-            'https': 'http://10.48.175.246:7897',
-        },
-        'timeout': 30000,
-    })
     try:
-        # 获取K线数据
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+        # 获取K线数据（直接调用币安REST接口）
+        r = _get_session().get(BINANCE_KLINES_URL,
+                               params={'symbol': symbol, 'interval': timeframe, 'limit': limit},
+                               timeout=30)
+        r.raise_for_status()
+        klines = r.json()
         
-        if not ohlcv:
+        if not klines:
             print("未获取到数据")
             return None
             
-        # 转换为DataFrame
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
+        # 转换为DataFrame：取前6个字段（开盘时间、开、高、低、收、量）一次解析为float64矩阵
+        arr = np.array([k[:6] for k in klines], dtype=np.float64)
+        ts = arr[:, 0].astype(np.int64).astype('datetime64[ms]')
+        df = pd.DataFrame({
+            'open': arr[:, 1],
+            'high': arr[:, 2],
+            'low': arr[:, 3],
+            'close': arr[:, 4],
+            'volume': arr[:, 5],
+        }, index=pd.DatetimeIndex(ts, name='timestamp'), copy=False)
         
         print(f"成功获取 {len(df)} 条 {symbol} 数据，时间范围: {df.index[0]} 到 {df.index[-1]}")
-        return df
         
     except Exception as e:
         print(f"获取数据失败: {e}")
         return None
 
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            df.to_parquet(cache_path)
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+    return df
+
 # 运行示例
 if __name__ == '__main__':
     print("开始DFA策略回测（14天定投70美元，75%收益率减仓50%，冷却期30天）")
     print("=" * 60)
     
     run_dfa_binance_backtest(symbol='SUIUSDT', data_limit=1000)
-    #run_dfa_binance_backtest(symbol='SOLUSDT', data_limit=1000)
\ No newline at end of file
+    #run_dfa_binance_backtest(symbol='SOLUSDT', data_limit=1000)
+    #test_multiple_crypto_assets()
+    #run_dfa_sweep('SOLUSDT', {'target_return': [50, 75, 100], 'sell_ratio': [0.3, 0.5]})
+    #run_dfa_grid(['BTCUSDT', 'SOLUSDT'], {'target_return': [50, 75, 100], 'sell_ratio': [0.3, 0.5]})
\ No newline at end of file